@@ -5,9 +5,10 @@ import seaborn as sns
 import os
 import statsmodels.api as sm
 from statsmodels.stats.multitest import multipletests
-from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error
-from sklearn.model_selection import LeaveOneOut, cross_val_predict
+
+from src.analysis.backends import get_backend, pearson_pvalue
+from src.analysis.subset_selection import search_subsets
 
 def _plot_correlation_heatmap(ax, df):
     sns.heatmap(df.astype(float), annot=True, cmap='RdBu_r', center=0, fmt='.3f', ax=ax, cbar_kws={'label': 'Correlation'})
@@ -162,7 +163,7 @@ def calculate_fundamental_metrics(fund_df):
     
     return metrics
 
-def run_comovement_analysis(stock_returns, code_to_name, alpha=0.05):
+def run_comovement_analysis(stock_returns, code_to_name, alpha=0.05, backend=None):
     """Pairwise correlation of the firms' annual returns, with FDR correction.
 
     This is a positive control. The fundamentals-to-returns regression finds no
@@ -173,21 +174,21 @@ def run_comovement_analysis(stock_returns, code_to_name, alpha=0.05):
     evidence it discriminates signal from noise rather than always returning null.
     """
     import itertools
-    from scipy.stats import pearsonr
 
     returns = stock_returns.rename(columns=code_to_name)
     companies = [c for c in code_to_name.values() if c in returns.columns]
 
+    r, p, n_obs = get_backend(backend).pairwise_pearson(
+        returns[companies].to_numpy(dtype=float), min_obs=3)
+
     rows, raw_p = [], []
-    for a, b in itertools.combinations(companies, 2):
-        pair = returns[[a, b]].dropna()
-        if len(pair) < 3:
+    for i, j in itertools.combinations(range(len(companies)), 2):
+        if np.isnan(r[i, j]):
             continue
-        r, p = pearsonr(pair[a], pair[b])
-        rows.append({'company_a': a, 'company_b': b,
-                     'correlation': float(r), 'p_value': float(p),
-                     'n_obs': int(len(pair))})
-        raw_p.append(p)
+        rows.append({'company_a': companies[i], 'company_b': companies[j],
+                     'correlation': float(r[i, j]), 'p_value': float(p[i, j]),
+                     'n_obs': int(n_obs[i, j])})
+        raw_p.append(p[i, j])
 
     if raw_p:
         reject, p_adj, _, _ = multipletests(raw_p, alpha=alpha, method='fdr_bh')
@@ -199,42 +200,133 @@ def run_comovement_analysis(stock_returns, code_to_name, alpha=0.05):
     return rows
 
 
-def run_correlation_analysis(stock_data, fund_metrics, code_to_name):
-    names = list(code_to_name.values())
-    corr_data = {comp: {metric: np.nan for metric in fund_metrics.keys()} for comp in names}
+def _lagged_panel(stock_returns, fund_metrics, code_to_name, lags=(0,)):
+    """Stack every firm's returns and lagged fundamentals onto the return dates.
 
-    for code, company in code_to_name.items():
-        X, y, features = _align_data(stock_data, fund_metrics, code, company)
-        if X is None:
-            continue
+    Returns `(y, X, companies, metrics)` with `y` shaped (dates, companies) and `X`
+    shaped (dates, companies, metrics, lags). A lag of L matches the year-t return to
+    the year-(t-L) fundamental, as in `_align_data`. Missing cells stay NaN instead
+    of being dropped, so each (company, metric, lag) later keeps every row it has.
+    """
+    codes = [c for c in code_to_name if c in stock_returns.columns]
+    companies = [code_to_name[c] for c in codes]
+    metrics = list(fund_metrics.keys())
+    dates = stock_returns.index
+
+    y = stock_returns[codes].to_numpy(dtype=float)
+    X = np.full((len(dates), len(codes), len(metrics), len(lags)), np.nan)
+    for m, metric in enumerate(metrics):
+        frame = fund_metrics[metric].reindex(columns=companies)
+        for l, lag in enumerate(lags):
+            shifted = frame
+            if lag:
+                shifted = frame.copy()
+                shifted.index = shifted.index + pd.DateOffset(years=lag)
+            X[:, :, m, l] = shifted.reindex(dates).to_numpy(dtype=float)
+
+    return y, X, companies, metrics
+
+
+def _nan_corr_cube(y, X, min_obs=10):
+    """Pairwise-complete Pearson correlation of `y` against every slice of `X`.
+
+    `y` is (dates, companies) and `X` is (dates, companies, ...); the correlation is
+    taken along the date axis in one masked-array pass. Each cell uses exactly the
+    dates where both its return and its fundamental are finite. Returns arrays of
+    the correlation, the number of observations behind it, and the two-sided
+    p-value (the same t-test `scipy.stats.pearsonr` uses). Cells with fewer than
+    `min_obs` observations, or with a constant series, get NaN r and p.
+    """
+    y = np.broadcast_to(y.reshape(y.shape + (1,) * (X.ndim - y.ndim)), X.shape)
+    mask = ~(np.isfinite(X) & np.isfinite(y))
+    xm = np.ma.masked_array(X, mask=mask)
+    ym = np.ma.masked_array(y, mask=mask)
+    n_obs = (~mask).sum(axis=0)
+
+    dx = xm - xm.mean(axis=0)
+    dy = ym - ym.mean(axis=0)
+    sxy = (dx * dy).sum(axis=0)
+    sxx = (dx * dx).sum(axis=0)
+    syy = (dy * dy).sum(axis=0)
+    # np.ma masks zero-variance denominators itself, so those cells come out NaN.
+    r = np.ma.filled(sxy / np.ma.sqrt(sxx * syy), np.nan)
+    r = np.clip(np.asarray(r, dtype=float), -1.0, 1.0)
+    r[n_obs < max(min_obs, 3)] = np.nan
+
+    return r, n_obs, pearson_pvalue(r, n_obs)
+
+
+def run_correlation_cube(stock_returns, fund_metrics, code_to_name, lags=(0, 1),
+                         min_obs=10, alpha=0.05):
+    """Correlation of each firm's return with each metric at each lag, in one pass.
+
+    Unlike the regression, which needs every metric present on a date, each
+    (company, metric, lag) cell here uses all of its pairwise-complete years, so a
+    firm with a partial metric history still contributes the rows it has. Every row
+    reports its observation count and raw p-value, and Benjamini-Hochberg is applied
+    across the whole cube because each cell is a separate test.
+    """
+    lags = tuple(lags)
+    y, X, companies, metrics = _lagged_panel(stock_returns, fund_metrics,
+                                             code_to_name, lags)
+    r, n_obs, p = _nan_corr_cube(y, X, min_obs=min_obs)
+
+    rows, raw_p = [], []
+    for c, company in enumerate(companies):
+        for m, metric in enumerate(metrics):
+            for l, lag in enumerate(lags):
+                rows.append({'company': company, 'variable': metric, 'lag': lag,
+                             'correlation': float(r[c, m, l]),
+                             'p_value': float(p[c, m, l]),
+                             'n_obs': int(n_obs[c, m, l])})
+
+    tested = [row for row in rows if not np.isnan(row['p_value'])]
+    for row in rows:
+        row['p_value_fdr'] = np.nan
+        row['significant'] = False
+    if tested:
+        reject, p_adj, _, _ = multipletests([row['p_value'] for row in tested],
+                                            alpha=alpha, method='fdr_bh')
+        for row, rej, padj in zip(tested, reject, p_adj):
+            row['p_value_fdr'] = float(padj)
+            row['significant'] = bool(rej)
+
+    return rows
+
+
+def run_correlation_analysis(stock_data, fund_metrics, code_to_name, min_obs=10):
+    """Same-year correlation of each firm's return with each fundamental metric.
+
+    A company-by-metric table backed by the batched kernel in `_nan_corr_cube`.
+    Each cell uses every year where both series are present, rather than only the
+    dates where all metrics line up at once.
+    """
+    names = list(code_to_name.values())
+    corr_df = pd.DataFrame(np.nan, index=names, columns=list(fund_metrics.keys()))
 
-        for i, feature in enumerate(features):
-            corr = np.corrcoef(y, X.iloc[:, i].values)[0, 1]
-            if not np.isnan(corr):
-                corr_data[company][feature] = corr
+    y, X, companies, metrics = _lagged_panel(stock_data, fund_metrics, code_to_name)
+    r, _, _ = _nan_corr_cube(y, X, min_obs=min_obs)
+    for c, company in enumerate(companies):
+        corr_df.loc[company, metrics] = r[c, :, 0]
 
-    return pd.DataFrame(corr_data).T
+    return corr_df
 
-def _permutation_pvalue(X_const, y, observed_r2, n_permutations=2000, seed=42):
+def _permutation_pvalue(X_const, y, observed_r2, n_permutations=2000, seed=42,
+                        backend=None):
     """Empirical p-value for an OLS R^2 under label permutation.
 
     Refits the model on shuffled targets `n_permutations` times and returns the
     fraction of shuffles (with the standard +1 smoothing) whose R^2 is at least the
     observed R^2. A high value means the observed fit is indistinguishable from noise.
+    The refits run on the selected compute backend (see `backends.py`).
     """
-    rng = np.random.default_rng(seed)
-    y_values = np.asarray(y, dtype=float)
-    X_values = np.asarray(X_const, dtype=float)
-    at_least = 0
-    for _ in range(n_permutations):
-        permuted = rng.permutation(y_values)
-        null_r2 = sm.OLS(permuted, X_values).fit().rsquared
-        if null_r2 >= observed_r2:
-            at_least += 1
+    at_least = get_backend(backend).permutation_count(
+        X_const, y, observed_r2, n_permutations, seed)
     return (at_least + 1) / (n_permutations + 1)
 
 
-def run_regression_analysis(stock_returns, fund_metrics, code_to_name, alpha=0.05, lag=0):
+def run_regression_analysis(stock_returns, fund_metrics, code_to_name, alpha=0.05, lag=0,
+                            backend=None):
     # First pass: fit one OLS per company and collect every coefficient test.
     # lag=0 regresses the year-t return on year-t fundamental growth (a same-year,
     # contemporaneous fit). lag=1 regresses it on the prior year's growth (a one-year-
@@ -242,6 +334,7 @@ def run_regression_analysis(stock_returns, fund_metrics, code_to_name, alpha=0.0
     # directly comparable.
     regression_results = {}
     flat_tests = []  # (company, feature, raw_p)
+    backend = get_backend(backend)
 
     for code, name in code_to_name.items():
         X, y, features = _align_data(stock_returns, fund_metrics, code, name, lag=lag)
@@ -263,8 +356,7 @@ def run_regression_analysis(stock_returns, fund_metrics, code_to_name, alpha=0.0
         # report a leave-one-out cross-validated RMSE that reflects out-of-sample
         # error.
         in_sample_mse = mean_squared_error(y, ols.predict(X_const))
-        cv_pred = cross_val_predict(LinearRegression(), X.values, y.values,
-                                    cv=LeaveOneOut())
+        cv_pred = backend.loo_predictions(X.values, y.values)
         cv_rmse = np.sqrt(mean_squared_error(y, cv_pred))
 
         # Permutation test on R^2: with only ~17 points and 5 predictors, OLS fits a
@@ -272,7 +364,7 @@ def run_regression_analysis(stock_returns, fund_metrics, code_to_name, alpha=0.0
         # so the distribution of R^2 over many shuffles is the null. The empirical
         # p-value is the share of shuffles whose R^2 is at least the observed one;
         # a large p-value means the in-sample fit is within what pure chance yields.
-        perm_p = _permutation_pvalue(X_const, y, ols.rsquared)
+        perm_p = _permutation_pvalue(X_const, y, ols.rsquared, backend=backend)
 
         regression_results[name] = {
             'r2': float(ols.rsquared),
@@ -332,6 +424,46 @@ def run_regression_analysis(stock_returns, fund_metrics, code_to_name, alpha=0.0
     
     return regression_results, top_3_vars, top_vars_by_company
 
+def run_subset_selection(stock_returns, fund_metrics, code_to_name, lags=(0, 1),
+                         criteria=('aicc', 'bic', 'press'), max_features=None,
+                         max_subsets=2 ** 16):
+    """Best regressor subset for each firm, lag and selection criterion.
+
+    Fitting all metrics together on ~17 points overfits, so this scores the
+    candidate subsets (intercept-only included, at most n // 4 regressors by
+    default) by AICc (AIC with its small-sample correction), BIC and leave-one-out
+    PRESS and reports the winner under each. The search is exhaustive when the
+    number of subsets is within `max_subsets`, stepwise otherwise (see
+    `subset_selection.py`). This is model selection only: it reports no p-values,
+    because tests on a model chosen from the same data would be optimistic.
+    """
+    rows = []
+    for code, name in code_to_name.items():
+        for lag in lags:
+            X, y, features = _align_data(stock_returns, fund_metrics, code, name, lag=lag)
+            if X is None or y is None:
+                continue
+            data = pd.concat([X, y.rename('_return')], axis=1).dropna()
+            for criterion in criteria:
+                best, method, n_scored = search_subsets(
+                    data[features].values, data['_return'].values, criterion=criterion,
+                    max_features=max_features, max_subsets=max_subsets)
+                winner = best[0]
+                rows.append({
+                    'company': name,
+                    'lag': lag,
+                    'criterion': criterion,
+                    'method': method,
+                    'n_subsets_scored': n_scored,
+                    'n_obs': int(len(data)),
+                    'features': [features[j] for j in winner['features']],
+                    'aic': winner['aic'],
+                    'aicc': winner['aicc'],
+                    'bic': winner['bic'],
+                    'press': winner['press'],
+                })
+    return rows
+
 def create_visualizations(corr_df, reg_results, top_vars):
     output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'output')
     os.makedirs(output_dir, exist_ok=True)
@@ -0,0 +1,292 @@
+"""Compute backends for the numeric hot paths of the analysis.
+
+The regression and co-movement code spend almost all of their time in three loops:
+the R^2 permutation test, the leave-one-out refits, and the pairwise return
+correlations. Each backend implements those same operations behind one interface,
+so `analysis.py` picks a backend by name and never branches on it.
+
+- `numpy` (the default) is the reference: statsmodels, scikit-learn and scipy,
+  exactly as the analysis has always run.
+- `numba` runs the same three loops as compiled kernels. Numba is optional and is
+  only imported when this backend is selected, so users who don't opt in never pay
+  for the dependency.
+
+The single per-firm OLS fit in `run_regression_analysis` is not part of the
+interface. It runs once per firm, and its statsmodels results (coefficient
+p-values, adjusted R^2) feed the FDR step, so it stays on the reference path.
+The OLS work a backend does compile is the thousands of refits inside the
+permutation test and the LOO loop.
+
+The backend is chosen by `COMPUTE_BACKEND` in `constants.py` (overridable through
+the STOCKMETRICS_BACKEND environment variable) or by the `backend=` argument of the
+analysis functions.
+"""
+import itertools
+
+import numpy as np
+import statsmodels.api as sm
+from scipy.stats import pearsonr, t as t_dist
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import LeaveOneOut, cross_val_predict
+
+from src.constants import COMPUTE_BACKEND
+
+
+def pearson_pvalue(r, n_obs):
+    """Two-sided p-value of a Pearson r on `n_obs` points, as `pearsonr` reports it."""
+    r = np.asarray(r, dtype=float)
+    dof = np.asarray(n_obs) - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_stat = r * np.sqrt(dof / (1.0 - r * r))
+        p = 2.0 * t_dist.sf(np.abs(t_stat), dof)
+    return np.where(np.isnan(r), np.nan, p)
+
+
+class NumpyBackend:
+    """Reference backend: the statsmodels / scikit-learn / scipy code path."""
+
+    name = 'numpy'
+
+    def permutation_count(self, X_const, y, observed_r2, n_permutations, seed):
+        """Number of label shuffles whose OLS R^2 is at least `observed_r2`."""
+        rng = np.random.default_rng(seed)
+        y_values = np.asarray(y, dtype=float)
+        X_values = np.asarray(X_const, dtype=float)
+        at_least = 0
+        for _ in range(n_permutations):
+            permuted = rng.permutation(y_values)
+            null_r2 = sm.OLS(permuted, X_values).fit().rsquared
+            if null_r2 >= observed_r2:
+                at_least += 1
+        return at_least
+
+    def loo_predictions(self, X, y):
+        """Leave-one-out predictions of an OLS with intercept (X has no constant)."""
+        return cross_val_predict(LinearRegression(), np.asarray(X, dtype=float),
+                                 np.asarray(y, dtype=float), cv=LeaveOneOut())
+
+    def pairwise_pearson(self, values, min_obs=3):
+        """Pairwise-complete correlation between the columns of `values`.
+
+        Returns (r, p, n_obs) as square matrices. Pairs with fewer than `min_obs`
+        shared observations get NaN r and p.
+        """
+        values = np.asarray(values, dtype=float)
+        k = values.shape[1]
+        r = np.full((k, k), np.nan)
+        p = np.full((k, k), np.nan)
+        n_obs = np.zeros((k, k), dtype=int)
+        finite = np.isfinite(values)
+        for a, b in itertools.combinations(range(k), 2):
+            both = finite[:, a] & finite[:, b]
+            n_obs[a, b] = n_obs[b, a] = int(both.sum())
+            if n_obs[a, b] < min_obs:
+                continue
+            r_ab, p_ab = pearsonr(values[both, a], values[both, b])
+            r[a, b] = r[b, a] = r_ab
+            p[a, b] = p[b, a] = p_ab
+        return r, p, n_obs
+
+
+def _column_basis(X):
+    """Orthonormal basis of X's column space (rank-revealing, like statsmodels' pinv)."""
+    X = np.asarray(X, dtype=float)
+    U, s, _ = np.linalg.svd(X, full_matrices=False)
+    if s.size == 0:
+        return U
+    tol = s[0] * max(X.shape) * np.finfo(float).eps
+    return np.ascontiguousarray(U[:, s > tol])
+
+
+def _has_constant(X):
+    """Whether X carries an intercept column, which makes R^2 centered."""
+    X = np.asarray(X, dtype=float)
+    return bool(np.any((np.ptp(X, axis=0) == 0) & (X[0] != 0)))
+
+
+_numba_kernels = None
+
+
+def _load_numba_kernels():
+    """Compile the Numba kernels on first use, so numba stays an optional import."""
+    global _numba_kernels
+    if _numba_kernels is not None:
+        return _numba_kernels
+
+    try:
+        from numba import njit
+    except ImportError as exc:
+        raise ImportError(
+            "The 'numba' compute backend requires numba (pip install numba). "
+            "Use the default 'numpy' backend otherwise."
+        ) from exc
+
+    @njit
+    def permutation_count(U, y, observed_r2, orders, centered):
+        # R^2 only depends on y through its projection on the column space, so
+        # each shuffle costs one U'y product instead of a full refit.
+        n, k = U.shape
+        yp = np.empty(n)
+        yy = 0.0
+        for i in range(n):
+            yy += y[i] * y[i]
+        tss = yy
+        if centered:
+            tss = yy - n * np.mean(y) ** 2
+        at_least = 0
+        for p in range(orders.shape[0]):
+            for i in range(n):
+                yp[i] = y[orders[p, i]]
+            explained = 0.0
+            for c in range(k):
+                s = 0.0
+                for i in range(n):
+                    s += U[i, c] * yp[i]
+                explained += s * s
+            if 1.0 - (yy - explained) / tss >= observed_r2:
+                at_least += 1
+        return at_least
+
+    @njit
+    def loo_predictions(U, y, tol):
+        # Exact leave-one-out identity for OLS: the held-out residual is the
+        # in-sample residual divided by (1 - leverage), so no refits are needed.
+        # The identity breaks down as leverage reaches 1 (the point alone pins a
+        # regressor); those rows come back NaN for the caller to refit directly.
+        n, k = U.shape
+        proj = np.zeros(k)
+        for c in range(k):
+            for j in range(n):
+                proj[c] += U[j, c] * y[j]
+        pred = np.empty(n)
+        for i in range(n):
+            fitted = 0.0
+            leverage = 0.0
+            for c in range(k):
+                fitted += U[i, c] * proj[c]
+                leverage += U[i, c] * U[i, c]
+            if 1.0 - leverage < tol:
+                pred[i] = np.nan
+            else:
+                pred[i] = y[i] - (y[i] - fitted) / (1.0 - leverage)
+        return pred
+
+    @njit
+    def pairwise_pearson(values, min_obs):
+        n, k = values.shape
+        r = np.full((k, k), np.nan)
+        n_obs = np.zeros((k, k), dtype=np.int64)
+        for a in range(k):
+            for b in range(a + 1, k):
+                cnt = 0
+                sa = 0.0
+                sb = 0.0
+                for i in range(n):
+                    if np.isfinite(values[i, a]) and np.isfinite(values[i, b]):
+                        cnt += 1
+                        sa += values[i, a]
+                        sb += values[i, b]
+                n_obs[a, b] = cnt
+                n_obs[b, a] = cnt
+                if cnt < min_obs:
+                    continue
+                ma = sa / cnt
+                mb = sb / cnt
+                sab = 0.0
+                saa = 0.0
+                sbb = 0.0
+                for i in range(n):
+                    if np.isfinite(values[i, a]) and np.isfinite(values[i, b]):
+                        da = values[i, a] - ma
+                        db = values[i, b] - mb
+                        sab += da * db
+                        saa += da * da
+                        sbb += db * db
+                if saa > 0.0 and sbb > 0.0:
+                    rab = max(-1.0, min(1.0, sab / np.sqrt(saa * sbb)))
+                    r[a, b] = rab
+                    r[b, a] = rab
+        return r, n_obs
+
+    _numba_kernels = {
+        'permutation_count': permutation_count,
+        'loo_predictions': loo_predictions,
+        'pairwise_pearson': pairwise_pearson,
+    }
+    return _numba_kernels
+
+
+class NumbaBackend:
+    """Numba-compiled backend for long permutation runs and large pair loops.
+
+    Matches the reference backend's results to floating-point precision. The
+    permutation test scores the very same shuffles as the reference: they are
+    drawn in Python from `np.random.default_rng(seed)` and handed to the kernel as
+    index arrays, so both backends count the same permutations.
+    """
+
+    name = 'numba'
+
+    def __init__(self):
+        self._kernels = _load_numba_kernels()
+
+    # Shuffles are generated and scored in blocks so long runs stay within a small,
+    # fixed amount of memory.
+    _PERMUTATION_BLOCK = 4096
+
+    def permutation_count(self, X_const, y, observed_r2, n_permutations, seed):
+        # rng.permutation(n) consumes the generator exactly as rng.permutation(y)
+        # does in the reference backend, so y[order] is the same shuffle.
+        rng = np.random.default_rng(seed)
+        y = np.asarray(y, dtype=float)
+        U = _column_basis(X_const)
+        centered = _has_constant(X_const)
+        at_least = 0
+        for start in range(0, n_permutations, self._PERMUTATION_BLOCK):
+            size = min(self._PERMUTATION_BLOCK, n_permutations - start)
+            orders = np.array([rng.permutation(len(y)) for _ in range(size)])
+            at_least += int(self._kernels['permutation_count'](
+                U, y, float(observed_r2), orders.reshape(size, len(y)), centered))
+        return at_least
+
+    # Below this 1 - leverage the closed-form LOO residual is numerically unreliable.
+    _LEVERAGE_TOL = 1e-8
+
+    def loo_predictions(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        X_const = np.column_stack([np.ones(len(X)), X])
+        pred = self._kernels['loo_predictions'](_column_basis(X_const), y,
+                                                self._LEVERAGE_TOL)
+        # Refit the high-leverage rows on the reference path. Dropping such a row
+        # leaves the remaining design rank-deficient, and only the reference fit
+        # picks the same solution scikit-learn does.
+        for i in np.flatnonzero(np.isnan(pred)):
+            keep = np.arange(len(y)) != i
+            model = LinearRegression().fit(X[keep], y[keep])
+            pred[i] = model.predict(X[i:i + 1])[0]
+        return pred
+
+    def pairwise_pearson(self, values, min_obs=3):
+        r, n_obs = self._kernels['pairwise_pearson'](
+            np.ascontiguousarray(values, dtype=float), int(min_obs))
+        return r, pearson_pvalue(r, n_obs), n_obs
+
+
+BACKENDS = {
+    'numpy': NumpyBackend,
+    'numba': NumbaBackend,
+}
+
+
+def get_backend(backend=None):
+    """Resolve a backend name (or pass through an instance); None means the default."""
+    if backend is None:
+        backend = COMPUTE_BACKEND
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown compute backend {backend!r}; choose from {sorted(BACKENDS)}"
+        )
+    return BACKENDS[backend]()
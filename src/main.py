@@ -4,8 +4,10 @@ from src.utils.data_loader import load_data, clean_stock_data
 from src.analysis.analysis import (
     calculate_fundamental_metrics,
     run_correlation_analysis,
+    run_correlation_cube,
     run_regression_analysis,
     run_comovement_analysis,
+    run_subset_selection,
     create_visualizations
 )
 
@@ -20,6 +22,10 @@ def main():
     print(f"Metrics calculated: {list(fund_metrics.keys())}")
 
     corr_df = run_correlation_analysis(stock_returns, fund_metrics, code_to_name)
+    # Every (company, metric, lag) correlation with its observation count and raw
+    # and FDR-adjusted p-values, same-year and one year ahead.
+    corr_cube = run_correlation_cube(stock_returns, fund_metrics, code_to_name,
+                                     lags=(0, 1))
     # Two regressions on the same data: contemporaneous (year-t return on year-t
     # fundamental growth) and predictive (year-t return on the prior year's growth).
     # The first asks whether fundamentals and returns move together in the same year;
@@ -29,12 +35,17 @@ def main():
     reg_results_pred, top_3_pred, _ = run_regression_analysis(
         stock_returns, fund_metrics, code_to_name, lag=1)
     comovement = run_comovement_analysis(stock_returns, code_to_name)
+    # Best regressor subset per firm and horizon under AICc, BIC and LOO PRESS, as a
+    # check on how many of the five metrics the data can actually support.
+    subsets = run_subset_selection(stock_returns, fund_metrics, code_to_name, lags=(0, 1))
 
     create_visualizations(corr_df, reg_results, top_3_vars)
 
     output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'output')
 
     corr_df.to_csv(os.path.join(output_dir, 'complete_correlation_matrix.csv'))
+    pd.DataFrame(corr_cube).to_csv(
+        os.path.join(output_dir, 'correlation_cube.csv'), index=False)
 
     _write_regression_csvs(reg_results, output_dir, 'complete_regression_results.csv',
                            'coefficient_tests.csv')
@@ -52,6 +63,11 @@ def main():
 
     pd.DataFrame(comovement).to_csv(
         os.path.join(output_dir, 'stock_comovement.csv'), index=False)
+
+    subset_df = pd.DataFrame(subsets)
+    if not subset_df.empty:
+        subset_df['features'] = subset_df['features'].apply(', '.join)
+    subset_df.to_csv(os.path.join(output_dir, 'subset_selection.csv'), index=False)
     
     print("\n=== Results summary ===")
     print("\nCorrelation description:")
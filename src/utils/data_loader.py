@@ -1,6 +1,11 @@
 import pandas as pd
 import os
-from src.constants import EXPECTED_STOCK_CODE_TO_NAME
+from src.utils.security_master import (
+    SecurityMasterMismatch,
+    diff_listing,
+    extract_listing,
+    load_master,
+)
 
 
 def load_data():
@@ -28,57 +33,45 @@ def load_data():
     return stock_df, fund_df, code_to_name
 
 
-def derive_code_to_name(stock_df, fund_df):
+def validate_listing(stock_df, fund_df, master=None, as_of=None):
+    """Check a data drop against the security master without raising.
+
+    Returns the structured diff from `diff_listing` (one row per symbol, ISIN or
+    name change), empty when the file matches. Use this to review a new drop
+    before recording its changes with `apply_diff`; `derive_code_to_name` runs the
+    same check but refuses to produce a mapping while the diff is non-empty.
+    """
+    return _diff_against_master(extract_listing(stock_df, fund_df), master, as_of)
+
+
+def _diff_against_master(listing, master, as_of):
+    if master is None:
+        master = load_master()
+    return diff_listing(listing, master, as_of=as_of)
+
+
+def derive_code_to_name(stock_df, fund_df, master=None, as_of=None):
     """Build the authoritative stock-code -> fundamentals-name mapping by joining
     the two sheets on ISIN, the unambiguous security identifier.
 
     The original code hard-coded this mapping by hand and got three of five pairs
     wrong (e.g. the TCS stock symbol was labelled "Infosys"), silently pairing each
     company's returns with another company's fundamentals. Deriving it from ISIN
-    removes that whole class of error; we then cross-check against the documented
-    EXPECTED mapping and fail loudly if the file and our expectation disagree.
+    removes that whole class of error; the result is then checked against the
+    persisted security master, and any symbol, ISIN or name change is raised as a
+    `SecurityMasterMismatch` carrying the structured diff.
     """
-    # Sheet1 (stock) is laid out with metadata rows under the symbol header:
-    # row "Name", row "ISIN Number", row "Exchng Ticker", ... then dated prices.
-    label_col = stock_df.columns[0]
-    isin_rows = stock_df[stock_df[label_col].astype(str).str.strip() == 'ISIN Number']
-    if isin_rows.empty:
-        raise ValueError("Could not locate the 'ISIN Number' row in the stock sheet")
-    isin_row = isin_rows.iloc[0]
-
-    codes = [c for c in stock_df.columns if c != label_col]
-    code_to_isin = {code: str(isin_row[code]).strip() for code in codes}
-
-    # Sheet2 (fundamentals): ISIN -> Company name.
-    fund_isin_to_name = {
-        str(isin).strip(): name
-        for isin, name in fund_df[['ISIN', 'Company name']].drop_duplicates().values
-    }
-
-    code_to_name = {}
-    for code, isin in code_to_isin.items():
-        if isin not in fund_isin_to_name:
-            raise ValueError(
-                f"Stock symbol {code} (ISIN {isin}) has no matching fundamentals row"
-            )
-        code_to_name[code] = fund_isin_to_name[isin]
-
-    # Sanity gate: the file-derived mapping must match what we expect. If a future
-    # data drop reshuffles symbols or ISINs, this raises instead of silently
+    listing = extract_listing(stock_df, fund_df)
+
+    # Sanity gate: the file-derived mapping must match the reviewed master. If a
+    # future data drop reshuffles symbols or ISINs, this raises instead of silently
     # producing a mislabelled analysis.
-    mismatches = {
-        c: (code_to_name.get(c), EXPECTED_STOCK_CODE_TO_NAME.get(c))
-        for c in EXPECTED_STOCK_CODE_TO_NAME
-        if code_to_name.get(c) != EXPECTED_STOCK_CODE_TO_NAME.get(c)
-    }
-    if mismatches:
-        raise ValueError(
-            "ISIN-derived mapping disagrees with EXPECTED_STOCK_CODE_TO_NAME "
-            f"(derived, expected): {mismatches}. Update constants.py only after "
-            "confirming the new data file is correct."
-        )
-
-    return code_to_name
+    diff = _diff_against_master(listing, master, as_of)
+    if not diff.empty:
+        raise SecurityMasterMismatch(diff)
+
+    codes = [c for c in stock_df.columns if c != stock_df.columns[0]]
+    return dict(zip(codes, listing['name']))
 
 
 def clean_stock_data(df, codes):
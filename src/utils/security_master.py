@@ -0,0 +1,185 @@
+"""Persisted security master: stock symbol <-> ISIN <-> fundamentals name.
+
+The master is a small table with one row per listing and the dates it was valid:
+
+    symbol, isin, name, effective_from, effective_to
+
+A blank `effective_to` marks the listing as current. It is stored as
+`security_master.csv` next to `data.xls` and is the reviewed record of which
+security each stock symbol is. Every data drop is checked against it.
+
+The check is a pair of hash joins, on symbol and on ISIN, between the file's
+listing and the master's current rows. It returns only the deltas, as a
+structured table, so a renamed ticker or a reissued ISIN shows up as one labelled
+row rather than as an opaque failure. No per-security Python loop is involved,
+so a drop with thousands of securities validates in milliseconds.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+SECURITY_MASTER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'security_master.csv')
+
+MASTER_COLUMNS = ['symbol', 'isin', 'name', 'effective_from', 'effective_to']
+DIFF_COLUMNS = ['change', 'symbol', 'isin', 'name',
+                'master_symbol', 'master_isin', 'master_name']
+
+# Change kinds reported by `diff_listing`:
+#   unmatched       the file's ISIN has no fundamentals row, so it cannot be named
+#   isin_changed    known symbol, different ISIN
+#   name_changed    known security, different fundamentals name (alongside an
+#                   isin_changed or symbol_changed row when both moved)
+#   symbol_changed  known ISIN now listed under a different symbol, old one gone
+#   added           new symbol (a new security, or a second listing of a known
+#                   ISIN whose existing symbol is still in the file)
+#   removed         current master listing missing from the file
+CHANGE_KINDS = ('unmatched', 'isin_changed', 'name_changed', 'symbol_changed',
+                'added', 'removed')
+
+
+class SecurityMasterMismatch(ValueError):
+    """A data file disagrees with the security master; `diff` holds the deltas."""
+
+    def __init__(self, diff):
+        self.diff = diff
+        super().__init__(
+            f"Data file disagrees with the security master ({len(diff)} change(s)):\n"
+            f"{diff.to_string(index=False)}\n"
+            "Record these with apply_diff() and save_master() only after confirming "
+            "the new data file is correct."
+        )
+
+
+def load_master(path=None):
+    path = path or SECURITY_MASTER_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Security master not found: {path}")
+    return pd.read_csv(path, dtype={'symbol': str, 'isin': str, 'name': str},
+                       parse_dates=['effective_from', 'effective_to'])
+
+
+def save_master(master, path=None):
+    master = master[MASTER_COLUMNS].sort_values(['symbol', 'effective_from'])
+    master.to_csv(path or SECURITY_MASTER_PATH, index=False, date_format='%Y-%m-%d')
+
+
+def active_entries(master, as_of=None):
+    """Master rows in effect at `as_of`, or the open (current) rows if None."""
+    if as_of is None:
+        return master[master['effective_to'].isna()]
+    as_of = pd.Timestamp(as_of)
+    return master[(master['effective_from'] <= as_of)
+                  & (master['effective_to'].isna() | (master['effective_to'] > as_of))]
+
+
+def extract_listing(stock_df, fund_df):
+    """The file's own symbol -> ISIN -> fundamentals-name table.
+
+    Sheet1 (stock) carries metadata rows under the symbol header: "Name",
+    "ISIN Number", "Exchng Ticker", ... then dated prices. Sheet2 (fundamentals)
+    has one row per company and field, each with its ISIN. Returns one row per
+    stock column, in column order; `name` is NaN where the ISIN has no
+    fundamentals row.
+    """
+    label_col = stock_df.columns[0]
+    labels = stock_df[label_col].to_numpy()
+    # Exact match is one vectorized comparison; only fall back to a stripped string
+    # scan of the whole column when the label carries stray whitespace.
+    hits = np.flatnonzero(labels == 'ISIN Number')
+    if not hits.size:
+        hits = np.flatnonzero(
+            stock_df[label_col].astype(str).str.strip().to_numpy() == 'ISIN Number')
+    if not hits.size:
+        raise ValueError("Could not locate the 'ISIN Number' row in the stock sheet")
+    isin_row = stock_df.iloc[hits[0]].drop(label_col)
+
+    listing = pd.DataFrame({
+        'symbol': isin_row.index.astype(str),
+        'isin': isin_row.astype(str).str.strip().to_numpy(),
+    })
+    fund_names = (fund_df[['ISIN', 'Company name']]
+                  .assign(ISIN=lambda d: d['ISIN'].astype(str).str.strip())
+                  .drop_duplicates('ISIN', keep='last')
+                  .rename(columns={'ISIN': 'isin', 'Company name': 'name'}))
+    return listing.merge(fund_names, on='isin', how='left')
+
+
+def diff_listing(listing, master, as_of=None):
+    """Structured differences between a file's listing and the master.
+
+    Returns a DataFrame with DIFF_COLUMNS and one row per change (see
+    CHANGE_KINDS); it is empty when the file matches the master exactly.
+    """
+    current = active_entries(master, as_of)[['symbol', 'isin', 'name']]
+
+    by_symbol = listing.merge(current.add_prefix('master_'), how='left',
+                              left_on='symbol', right_on='master_symbol')
+    known_symbol = by_symbol['master_symbol'].notna()
+
+    # An unknown symbol is a ticker change only when its ISIN belonged to a master
+    # symbol that has vanished from the file; pull that old symbol across by a
+    # second join on ISIN. If the old symbol is still listed, the new one is a
+    # second listing of the same security (a dual listing) and counts as added.
+    vacated = current[~current['symbol'].isin(listing['symbol'])]
+    isin_owner = vacated.drop_duplicates('isin').set_index('isin')
+    moved = ~known_symbol & by_symbol['isin'].isin(isin_owner.index)
+    by_symbol.loc[moved, 'master_symbol'] = by_symbol.loc[moved, 'isin'].map(
+        isin_owner['symbol'])
+    by_symbol.loc[moved, 'master_isin'] = by_symbol.loc[moved, 'isin']
+    by_symbol.loc[moved, 'master_name'] = by_symbol.loc[moved, 'isin'].map(
+        isin_owner['name'])
+
+    by_symbol['change'] = np.select(
+        [by_symbol['name'].isna(),
+         known_symbol & (by_symbol['isin'] != by_symbol['master_isin']),
+         known_symbol & (by_symbol['name'] != by_symbol['master_name']),
+         moved,
+         ~known_symbol],
+        ['unmatched', 'isin_changed', 'name_changed', 'symbol_changed', 'added'],
+        default='')
+    # A ticker change or reissued ISIN can coincide with a rename. The primary
+    # change above hides the rename, so report it as its own row.
+    renamed = by_symbol[by_symbol['change'].isin(['isin_changed', 'symbol_changed'])
+                        & (by_symbol['name'] != by_symbol['master_name'])]
+    changed = pd.concat([by_symbol[by_symbol['change'] != ''],
+                         renamed.assign(change='name_changed')])
+
+    gone = vacated[~vacated['symbol'].isin(by_symbol.loc[moved, 'master_symbol'])]
+    removed = pd.DataFrame({
+        'change': 'removed',
+        'master_symbol': gone['symbol'],
+        'master_isin': gone['isin'],
+        'master_name': gone['name'],
+    })
+
+    diff = pd.concat([changed, removed], ignore_index=True).reindex(columns=DIFF_COLUMNS)
+    diff['change'] = pd.Categorical(diff['change'], categories=CHANGE_KINDS, ordered=True)
+    diff = diff.sort_values(['change', 'symbol', 'master_symbol']).reset_index(drop=True)
+    diff['change'] = diff['change'].astype(str)
+    return diff
+
+
+def apply_diff(master, diff, effective_date):
+    """Record reviewed changes in the master, effective from `effective_date`.
+
+    Superseded listings are closed (their `effective_to` is set) rather than
+    deleted, so the master keeps the full history of each symbol and ISIN.
+    """
+    if (diff['change'] == 'unmatched').any():
+        raise ValueError(
+            "Cannot record listings that have no fundamentals row: "
+            f"{diff.loc[diff['change'] == 'unmatched', 'symbol'].tolist()}"
+        )
+    effective_date = pd.Timestamp(effective_date)
+    master = master.copy()
+
+    closing = master['effective_to'].isna() & master['symbol'].isin(
+        diff['master_symbol'].dropna())
+    master.loc[closing, 'effective_to'] = effective_date
+
+    opened = diff[diff['change'] != 'removed'][['symbol', 'isin', 'name']]
+    opened = opened.drop_duplicates('symbol').assign(
+        effective_from=effective_date, effective_to=pd.NaT)
+    return pd.concat([master, opened], ignore_index=True)[MASTER_COLUMNS]
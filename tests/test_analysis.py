@@ -7,10 +7,19 @@ import pandas as pd
 import pytest
 import statsmodels.api as sm
 
-from src.constants import EXPECTED_STOCK_CODE_TO_NAME
-from src.utils.data_loader import derive_code_to_name
+from src.utils.data_loader import derive_code_to_name, validate_listing
+from src.utils.security_master import (
+    SecurityMasterMismatch,
+    apply_diff,
+    diff_listing,
+    extract_listing,
+    load_master,
+)
+from src.analysis.backends import get_backend
+from src.analysis.subset_selection import _GramSearch, search_subsets
 from src.analysis.analysis import (
     _permutation_pvalue,
+    run_correlation_cube,
     run_regression_analysis,
     run_comovement_analysis,
 )
@@ -43,12 +52,68 @@ def test_derive_code_to_name_uses_isin_join():
     assert mapping["620512"] == "Infosys Ltd."
 
 
-def test_derive_code_to_name_raises_on_expected_mismatch(monkeypatch):
+def test_derive_code_to_name_raises_on_master_mismatch():
     stock, fund = _fake_sheets()
-    # Tamper the expectation so the file-derived mapping disagrees with it.
-    monkeypatch.setitem(EXPECTED_STOCK_CODE_TO_NAME, "B01NPJ", "Wrong Company")
-    with pytest.raises(ValueError):
-        derive_code_to_name(stock, fund)
+    # Tamper the master so the file-derived mapping disagrees with it.
+    master = load_master()
+    master.loc[master["symbol"] == "B01NPJ", "name"] = "Wrong Company"
+    with pytest.raises(SecurityMasterMismatch) as excinfo:
+        derive_code_to_name(stock, fund, master=master)
+    diff = excinfo.value.diff
+    assert diff[["change", "symbol"]].values.tolist() == [["name_changed", "B01NPJ"]]
+
+    # The same diff is available without the exception, for reviewing a new drop.
+    pd.testing.assert_frame_equal(validate_listing(stock, fund, master=master), diff)
+    assert validate_listing(stock, fund).empty
+
+
+def test_security_master_diff_reports_each_change_kind():
+    stock, fund = _fake_sheets()
+    master = load_master()
+    # Ticker change and rename for Infosys, reissued ISIN for Wipro, one new
+    # listing, and Tech Mahindra dropped from the file.
+    stock = stock.rename(columns={"620512": "INFY01"}).drop(columns="BWFGD6")
+    stock.loc[1, "620605"] = "INE075A01999"
+    stock["NEW001"] = ["New Co", "INE000X01011", 1.0, 2.0]
+    fund.loc[fund["ISIN"] == "INE009A01021", "Company name"] = "Infosys Renamed Ltd."
+    fund = pd.concat([fund, pd.DataFrame({
+        "ISIN": ["INE075A01999", "INE000X01011"],
+        "Company name": ["Wipro Ltd.", "New Co Ltd."],
+        "Field": ["SALES", "SALES"],
+    })], ignore_index=True)
+
+    diff = diff_listing(extract_listing(stock, fund), master)
+    changes = dict(zip(diff["change"], zip(diff["symbol"], diff["master_symbol"])))
+    assert len(diff) == 5
+    assert set(changes) == {"isin_changed", "symbol_changed", "name_changed",
+                            "added", "removed"}
+    assert changes["symbol_changed"] == ("INFY01", "620512")
+    assert changes["name_changed"] == ("INFY01", "620512")
+    assert changes["isin_changed"] == ("620605", "620605")
+    assert changes["added"][0] == "NEW001"
+    assert changes["removed"][1] == "BWFGD6"
+
+    # Recording the reviewed changes closes the old listings and makes the file
+    # validate cleanly, while the history stays queryable by date.
+    updated = apply_diff(master, diff, "2026-01-01")
+    assert diff_listing(extract_listing(stock, fund), updated).empty
+    assert diff_listing(extract_listing(*_fake_sheets()), updated, as_of="2025-06-30").empty
+
+
+def test_security_master_dual_listing_settles():
+    stock, fund = _fake_sheets()
+    master = load_master()
+    # A second exchange code for Infosys, with the original still listed.
+    stock["INFYNS"] = ["Infosys", "INE009A01021", 1.0, 2.0]
+
+    diff = diff_listing(extract_listing(stock, fund), master)
+    assert diff[["change", "symbol"]].values.tolist() == [["added", "INFYNS"]]
+    updated = apply_diff(master, diff, "2026-01-01")
+    assert diff_listing(extract_listing(stock, fund), updated).empty
+
+    # Dropping one of the two listings is reported, even though the ISIN remains.
+    diff = diff_listing(extract_listing(stock.drop(columns="620512"), fund), updated)
+    assert diff[["change", "master_symbol"]].values.tolist() == [["removed", "620512"]]
 
 
 def test_permutation_pvalue_high_for_noise():
@@ -107,3 +172,153 @@ def test_regression_reports_no_significant_after_fdr():
     assert results["Firm A"]["significant_vars"] == []
     assert top3 == []
     assert 0.0 <= results["Firm A"]["perm_pvalue_r2"] <= 1.0
+
+
+def test_correlation_cube_matches_pairwise_pearsonr():
+    from scipy.stats import pearsonr
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2005-12-31", periods=17, freq="YE")
+    code_to_name = {"A": "Alpha", "B": "Beta"}
+    stock = pd.DataFrame(rng.normal(size=(17, 2)), index=dates, columns=["A", "B"])
+    metric = pd.DataFrame(rng.normal(size=(17, 2)), index=dates,
+                          columns=["Alpha", "Beta"])
+    # Beta's metric history starts late: it keeps the 12 years it has instead of
+    # being dropped for failing a strict all-metrics intersection.
+    metric.iloc[:5, 1] = np.nan
+    fund_metrics = {"m0": metric}
+
+    rows = run_correlation_cube(stock, fund_metrics, code_to_name, lags=(0, 1))
+    by_key = {(r["company"], r["lag"]): r for r in rows}
+
+    for code, name in code_to_name.items():
+        for lag in (0, 1):
+            shifted = metric[name].copy()
+            shifted.index = shifted.index + pd.DateOffset(years=lag)
+            pair = pd.concat([stock[code], shifted], axis=1, join="inner").dropna()
+            r, p = pearsonr(pair.iloc[:, 0], pair.iloc[:, 1])
+            row = by_key[(name, lag)]
+            assert row["n_obs"] == len(pair)
+            assert row["correlation"] == pytest.approx(r)
+            assert row["p_value"] == pytest.approx(p)
+    assert by_key[("Beta", 0)]["n_obs"] == 12
+
+
+def test_correlation_cube_skips_cells_below_min_obs():
+    dates = pd.date_range("2005-12-31", periods=17, freq="YE")
+    stock = pd.DataFrame({"A": np.arange(17.0)}, index=dates)
+    metric = pd.DataFrame({"Alpha": np.r_[np.arange(5.0), [np.nan] * 12]}, index=dates)
+    rows = run_correlation_cube(stock, {"m0": metric}, {"A": "Alpha"}, lags=(0,))
+    assert rows[0]["n_obs"] == 5
+    assert np.isnan(rows[0]["correlation"]) and not rows[0]["significant"]
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        get_backend("fortran")
+
+
+def test_numba_backend_matches_reference():
+    pytest.importorskip("numba")
+    ref, fast = get_backend("numpy"), get_backend("numba")
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(17, 5))
+    y = 0.5 * X[:, 0] + rng.normal(size=17)
+    X_const = sm.add_constant(X)
+
+    np.testing.assert_allclose(fast.loo_predictions(X, y), ref.loo_predictions(X, y))
+
+    # A regressor that is nonzero in a single year gives that year leverage 1, where
+    # the closed-form LOO shortcut fails and the row has to be refitted.
+    X_spike = np.column_stack([X[:, :2], np.eye(17)[:, 3]])
+    np.testing.assert_allclose(fast.loo_predictions(X_spike, y),
+                               ref.loo_predictions(X_spike, y))
+
+    values = rng.normal(size=(20, 4))
+    values[:5, 1] = np.nan
+    for got, want in zip(fast.pairwise_pearson(values), ref.pairwise_pearson(values)):
+        np.testing.assert_allclose(got, want, equal_nan=True)
+
+    # Both backends score the same seeded shuffles, so the counts are identical.
+    observed = sm.OLS(y, X_const).fit().rsquared
+    for seed in (1, 42):
+        assert (fast.permutation_count(X_const, y, observed, 5000, seed)
+                == ref.permutation_count(X_const, y, observed, 5000, seed))
+
+
+def test_subset_scores_match_statsmodels_refits():
+    import itertools
+
+    rng = np.random.default_rng(0)
+    n, p = 17, 4
+    X = rng.normal(size=(n, p))
+    y = 1.5 * X[:, 1] + rng.normal(size=n)
+
+    ranked, method, n_scored = search_subsets(X, y, criterion="aic", top=2 ** p)
+    assert method == "exhaustive" and n_scored == 2 ** p
+    for row in ranked:
+        cols = list(row["features"])
+        X_const = np.column_stack([np.ones(n), X[:, cols]])
+        ols = sm.OLS(y, X_const).fit()
+        hat = np.diag(X_const @ np.linalg.pinv(X_const))
+        press = np.sum((ols.resid / (1 - hat)) ** 2)
+        assert row["aic"] == pytest.approx(ols.aic)
+        assert row["aicc"] == pytest.approx(
+            ols.aic + 2 * (len(cols) + 1) * (len(cols) + 2) / (n - len(cols) - 2))
+        assert row["bic"] == pytest.approx(ols.bic)
+        assert row["press"] == pytest.approx(press)
+    assert ranked[0]["features"] == (1,)
+
+
+def test_subset_search_falls_back_to_stepwise_on_wide_feeds():
+    rng = np.random.default_rng(1)
+    n, p = 120, 60
+    X = rng.normal(size=(n, p))
+    y = 2.0 * X[:, 7] - 1.5 * X[:, 42] + rng.normal(scale=0.5, size=n)
+
+    best, method, n_scored = search_subsets(X, y, criterion="bic", max_features=5)
+    assert method == "stepwise"
+    assert n_scored < 1000
+    # With 58 noise columns on offer BIC may admit a stray one, but the real
+    # regressors must be found and the result must score at least as well as them.
+    assert {7, 42} <= set(best[0]["features"])
+    true_fit, _, _ = search_subsets(X[:, [7, 42]], y, criterion="bic")
+    assert best[0]["bic"] <= true_fit[0]["bic"] + 1e-9
+
+
+def test_subset_search_stays_small_on_short_noisy_sample():
+    # The real regime: ~17 annual points and a wide feed of fields that carry no
+    # signal. Neither near-saturated nor exact fits may win.
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(17, 60))
+    y = rng.normal(size=17)
+    for criterion in ("aic", "aicc", "bic", "press"):
+        best, _, _ = search_subsets(X, y, criterion=criterion)
+        assert len(best[0]["features"]) <= 17 // 4
+        assert np.isfinite(best[0][criterion])
+
+    # An exact fit (n=6, 5 regressors) is degenerate: only the intercept-only model
+    # leaves enough residual degrees of freedom.
+    X_exact = rng.normal(size=(6, 5))
+    best, _, n_scored = search_subsets(X_exact, rng.normal(size=6), criterion="aic")
+    assert best[0]["features"] == () and n_scored == 1
+    search = _GramSearch(X_exact, rng.normal(size=6))
+    exact = search.score(search.fit(range(5)))
+    assert all(exact[c] == np.inf for c in ("aic", "aicc", "bic", "press"))
+    assert search.score(search.fit(range(4)))["aicc"] == np.inf
+
+
+def test_subset_column_removal_matches_refit():
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(30, 6))
+    y = X @ rng.normal(size=6) + rng.normal(size=30)
+    search = _GramSearch(X, y)
+    full = search.fit([4, 0, 3, 5, 1])
+    for j in full.cols:
+        dropped = search.drop(full, j)
+        refit = search.fit([c for c in full.cols if c != j])
+        got, want = search.score(dropped), search.score(refit)
+        assert got["features"] == want["features"]
+        for criterion in ("aic", "aicc", "bic", "press"):
+            assert got[criterion] == pytest.approx(want[criterion])
+        np.testing.assert_allclose(dropped.L @ dropped.L.T, refit.L @ refit.L.T)